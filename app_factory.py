@@ -0,0 +1,53 @@
+# app_factory.py
+# Purpose: shared FastAPI app construction (metadata, CORS, JSON encoder,
+# OpenAPI override) so route modules don't each carry their own copy.
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
+import os
+
+API_TITLE = "Slide Generator"
+API_VERSION = "1.0.0"
+API_DESCRIPTION = "Creates simple PowerPoint decks from JSON input."
+
+# Public URL advertised in the OpenAPI schema; override per deployment
+# instead of hardcoding it at the route module.
+SERVER_URL = os.environ.get("SERVER_URL", "https://slide-agent-xs03.onrender.com")
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title=API_TITLE,
+        version=API_VERSION,
+        description=API_DESCRIPTION,
+        default_response_class=ORJSONResponse,  # Rust JSON encoder for the small reply paths
+    )
+
+    # Allow cross-origin requests for development.
+    # In production, tighten allow_origins to your domain.
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    def custom_openapi():
+        if app.openapi_schema:
+            return app.openapi_schema
+        schema = get_openapi(
+            title=API_TITLE,
+            version=API_VERSION,
+            description=API_DESCRIPTION,
+            routes=app.routes,
+        )
+        schema["servers"] = [
+            {"url": SERVER_URL, "description": "Render deployment"}
+        ]
+        app.openapi_schema = schema
+        return app.openapi_schema
+
+    app.openapi = custom_openapi
+    return app
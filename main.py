@@ -1,44 +1,155 @@
 # main.py
-# Purpose: expose a web API that builds a .pptx deck and returns a download URL.
+# Purpose: expose a web API that builds a .pptx deck and streams it back.
 
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.openapi.utils import get_openapi
-from pydantic import BaseModel, HttpUrl
+from app_factory import create_app
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from pydantic import BaseModel
 from pptx import Presentation
+from pptx.opc.package import OpcPackage
+from pptx.opc.packuri import PackURI
+from pptx.opc.serialized import _ZipPkgWriter
+from pptx.util import lazyproperty
+import pptx
+import asyncio
+import copy
+import hashlib
+import io
+import orjson
+import os
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
 from pathlib import Path
-import uuid
-from pptx.util import Pt
 from pptx.enum.text import MSO_AUTO_SIZE
 from typing import Optional, Dict, List
+from xml.sax.saxutils import escape as xml_escape
 
-app = FastAPI(
-    title="Slide Generator",
-    version="1.0.0",
-    description="Creates simple PowerPoint decks from JSON input."
-)
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# The blank template zip is identical for every request; read it once so
+# Presentation() doesn't stat/open/decompress default.pptx each time.
+_TEMPLATE_BYTES = Path(pptx.__file__).parent.joinpath("templates", "default.pptx").read_bytes()
+
+def _cached_next_partname(self, tmpl):
+    # python-pptx rescans every part in the package on each add_slide to
+    # find the next free partname, which makes deck building quadratic in
+    # slide count. Scan once per template, then just count up.
+    counters = self.__dict__.setdefault("_next_partname_counters", {})
+    n = counters.get(tmpl)
+    if n is None:
+        prefix = tmpl[: (tmpl % 42).find("42")]
+        n = sum(1 for p in self.iter_parts() if p.partname.startswith(prefix)) + 1
+    counters[tmpl] = n + 1
+    return PackURI(tmpl % n)
+
+OpcPackage.next_partname = _cached_next_partname
+
+@lazyproperty
+def _zipf(self):
+    # Default deflate level 6 burns most of the save time in zlib for a
+    # few KB of savings on tiny XML parts; level 1 keeps the save phase
+    # cheap at a negligible size cost.
+    return zipfile.ZipFile(self._pkg_file, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+
+_ZipPkgWriter._zipf = _zipf
+
+# Keep a fully parsed template Presentation around too: lxml deepcopy
+# is C-level and ~4-5x cheaper than re-running the ZIP + XML parse from
+# the cached bytes. Never mutated; each request clones it.
+_TEMPLATE_PRS = Presentation(io.BytesIO(_TEMPLATE_BYTES))
+
+def _new_presentation():
+    try:
+        return copy.deepcopy(_TEMPLATE_PRS)
+    except Exception:
+        # clone failed for some reason; fall back to re-parsing the bytes
+        return Presentation(io.BytesIO(_TEMPLATE_BYTES))
 
-# Allow cross-origin requests for development.
-# In production, tighten allow_origins to your domain.
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# The template never changes, so resolve layout indices and the body
+# placeholder idx once instead of rescanning them on every request.
+TITLE_LAYOUT_IDX = 0 if len(_TEMPLATE_PRS.slide_layouts) > 0 else 1
+BODY_LAYOUT_IDX = 1 if len(_TEMPLATE_PRS.slide_layouts) > 1 else 0
+BODY_PH_IDX = next(
+    (ph.placeholder_format.idx
+     for ph in _TEMPLATE_PRS.slide_layouts[BODY_LAYOUT_IDX].placeholders
+     if ph.has_text_frame and ph.placeholder_format.idx != 0),
+    None,
 )
 
-# Public directory for generated files.
+# DrawingML namespace for building paragraph XML directly instead of
+# via python-pptx proxies. The three possible font sizes are known at
+# import, so the per-size paragraph template (sz in hundredths of a
+# point) is baked into a string up front; only the text varies at runtime.
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_PARA_TMPL = {
+    pt: '<a:p><a:r><a:rPr lang="en-US" sz="%d"/><a:t>%%s</a:t></a:r></a:p>' % (pt * 100)
+    for pt in (18, 20, 24)
+}
+_FRAG_TMPL = '<f xmlns:a="%s">%%s</f>' % A_NS
+
+def _set_bullets(tf, part, font_pt):
+    # One XML string, one C-level parse, one append per slide; skips the
+    # per-bullet add_paragraph/run proxy churn.
+    tmpl = _PARA_TMPL[font_pt]
+    # escape each bullet exactly once here; python-pptx's p.text setter
+    # would re-sanitize (clear runs, rebuild <a:r>) on every assignment
+    bullets_xml = [xml_escape(b) for b in part]
+    paras = "".join(tmpl % b for b in bullets_xml)
+    frag = etree.fromstring(_FRAG_TMPL % paras)
+    txBody = tf._txBody
+    for p_el in txBody.findall(f"{{{A_NS}}}p"):
+        txBody.remove(p_el)
+    txBody.extend(frag)
+
+# Deck building is CPU-bound (lxml + zlib), so more threads than cores
+# just thrash the GIL. Cap the executor and, for true parallelism, run
+# multiple processes: uvicorn main:app --workers $(nproc) --loop uvloop --http httptools
+_MAX_WORKERS = min(os.cpu_count() or 2, 4)
+_EXECUTOR = ThreadPoolExecutor(max_workers=_MAX_WORKERS)
+
+app = create_app()
+
+# Scratch directory for generated decks. Responses stream from memory,
+# but anything written here (old deployments, on-disk caching) must not
+# grow without bound, so a sweeper deletes files past their TTL.
 PUBLIC_DIR = Path("public")
 PUBLIC_DIR.mkdir(exist_ok=True)
+FILE_TTL_SECONDS = 3600        # keep generated files for 1h
+SWEEP_INTERVAL_SECONDS = 300   # check every 5 min
+
+# Content-addressed cache: identical request bodies (retries, repeated
+# demos) hash to the same key and reuse the deck already on disk.
+CACHE_MAX_ENTRIES = 128
+_deck_cache = OrderedDict()  # key -> filename under PUBLIC_DIR
+
+def _cache_key(req):
+    body = orjson.dumps(req.model_dump(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+async def _sweeper():
+    while True:
+        cutoff = time.time() - FILE_TTL_SECONDS
+        for path in PUBLIC_DIR.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass  # raced with another worker; nothing to do
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
 
-# Mount /public so files are served over HTTP.
-app.mount("/public", StaticFiles(directory=PUBLIC_DIR), name="public")
+@app.on_event("startup")
+async def _tune_threadpool():
+    # Also bound Starlette's default 40-slot threadpool (used for any
+    # remaining sync endpoints/dependencies) to the same core count.
+    from anyio.to_thread import current_default_thread_limiter
+    current_default_thread_limiter().total_tokens = _MAX_WORKERS
 
-def chunk(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i:i+n]
+@app.on_event("startup")
+async def _start_sweeper():
+    asyncio.create_task(_sweeper())
 
 # Request schema. Validates incoming JSON.
 class SlideReq(BaseModel):
@@ -46,107 +157,124 @@ class SlideReq(BaseModel):
     slides: Optional[Dict[str, List[str]]] = None  # new grouped format
     bullets: Optional[List[str]] = None            # legacy support
 
-class SlideResp(BaseModel):
-    file_url: HttpUrl
-    message: str
+def _build_deck(req: SlideReq) -> bytes:
+    # CPU-bound deck construction; runs off the event loop in an executor.
 
-@app.post("/create_slide", response_model=SlideResp)
-def create_slide(req: SlideReq, request: Request):
+    # Normalize input to a slides dict
+    if req.slides is not None:
+        slides_dict = req.slides
+    else:
+        slides_dict = {"General": req.bullets}
+
+    # tuning knobs
+    MAX_PER_SLIDE = 5  # bullets per slide
+    BASE_FONT_PT = 24  # normal font size
+    MID_FONT_PT = 20  # if many bullets
+    SMALL_FONT_PT = 18  # if very many bullets
+
+    prs = _new_presentation()
+
+    title_layout = prs.slide_layouts[TITLE_LAYOUT_IDX]
+    cover = prs.slides.add_slide(title_layout)
     try:
-        # Normalize input to a slides dict
-        if req.slides is None and req.bullets is not None:
-            slides_dict = {"General": req.bullets}
-        elif req.slides is not None:
-            slides_dict = req.slides
-        else:
-            raise HTTPException(status_code=422, detail="Provide either slides{section:[...]} or bullets[...]")
-
-        # tuning knobs
-        MAX_PER_SLIDE = 5  # bullets per slide
-        BASE_FONT_PT = 24  # normal font size
-        MID_FONT_PT = 20  # if many bullets
-        SMALL_FONT_PT = 18  # if very many bullets
-
-        prs = Presentation()
-
-        title_layout = prs.slide_layouts[0] if len(prs.slide_layouts) > 0 else prs.slide_layouts[1]
-        cover = prs.slides.add_slide(title_layout)
-        try:
-            cover.shapes.title.text = req.title
-        except Exception:
-            pass
-
-        for subindustry, bullets in slides_dict.items():            # split long lists across multiple slides
-            parts = list(chunk(bullets, MAX_PER_SLIDE))
-            total = len(parts)
-
-            for idx, part in enumerate(parts, start=1):
-                layout = prs.slide_layouts[1] if len(prs.slide_layouts) > 1 else prs.slide_layouts[0]
-                slide = prs.slides.add_slide(layout)
-
-                # title: add page marker if split
-                slide_title = subindustry if total == 1 else f"{subindustry} ({idx}/{total})"
-                slide.shapes.title.text = slide_title
-
-                # find body placeholder
-                body_ph = None
-                for ph in slide.placeholders:
-                    if ph.has_text_frame and ph != slide.shapes.title:
-                        body_ph = ph
-                        break
-                if body_ph is None:
-                    continue
-
-                tf = body_ph.text_frame
-                tf.clear()
-                tf.word_wrap = True
-                tf.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE  # shrink-to-fit if needed
-
-                # pick font size based on bullets on THIS slide
-                if len(part) > 6:
-                    font_pt = SMALL_FONT_PT
-                elif len(part) > 4:
-                    font_pt = MID_FONT_PT
-                else:
-                    font_pt = BASE_FONT_PT
-
-                # build bullets
-                for i, b in enumerate(part):
-                    p = tf.add_paragraph() if i > 0 else tf.paragraphs[0]
-                    p.text = b
-                    p.level = 0
-                    for run in p.runs:
-                        run.font.size = Pt(font_pt)
-
-        fname = f"{uuid.uuid4().hex}.pptx"
-        out_path = PUBLIC_DIR / fname
-        prs.save(out_path)
-        base = str(request.base_url).rstrip("/")
-        return {
-            "file_url": f"{base}/public/{fname}",
-            "message": f"✅ Healthcare deck ready: [Download PowerPoint]({base}/public/{fname})"
-        }
+        cover.shapes.title.text = req.title
+    except Exception:
+        pass
+
+    # one SlideLayout proxy for the whole deck, not one per slide
+    body_layout = prs.slide_layouts[BODY_LAYOUT_IDX]
+
+    for subindustry, bullets in slides_dict.items():            # split long lists across multiple slides
+        parts = [bullets[i:i+MAX_PER_SLIDE] for i in range(0, len(bullets), MAX_PER_SLIDE)]
+        total = len(parts)
+
+        for idx, part in enumerate(parts, start=1):
+            slide = prs.slides.add_slide(body_layout)
+
+            # title: add page marker if split
+            slide_title = subindustry if total == 1 else f"{subindustry} ({idx}/{total})"
+            slide.shapes.title.text = slide_title
 
+            # body placeholder idx was resolved from the template at import
+            if BODY_PH_IDX is None:
+                continue
+            try:
+                body_ph = slide.placeholders[BODY_PH_IDX]
+            except KeyError:
+                continue
+
+            tf = body_ph.text_frame
+            tf.word_wrap = True
+            tf.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE  # shrink-to-fit if needed
+
+            # pick font size based on bullets on THIS slide
+            if len(part) > 6:
+                font_pt = SMALL_FONT_PT
+            elif len(part) > 4:
+                font_pt = MID_FONT_PT
+            else:
+                font_pt = BASE_FONT_PT
+
+            _set_bullets(tf, part, font_pt)
+
+    # Serialize in memory; no disk round-trip.
+    bio = io.BytesIO()
+    prs.save(bio)
+    return bio.getvalue()
+
+@app.post("/create_slide")
+async def create_slide(req: SlideReq, request: Request, format: str = "stream"):
+    if req.slides is None and req.bullets is None:
+        raise HTTPException(status_code=422, detail="Provide either slides{section:[...]} or bullets[...]")
+    try:
+        key = _cache_key(req)
+        deck_path = PUBLIC_DIR / f"{key}.pptx"
+        if key in _deck_cache and deck_path.is_file():
+            # duplicate request: serve the deck built last time
+            _deck_cache.move_to_end(key)
+            buf = deck_path.read_bytes()
+        else:
+            # Keep the event loop free while python-pptx churns.
+            buf = await asyncio.get_running_loop().run_in_executor(_EXECUTOR, _build_deck, req)
+            deck_path.write_bytes(buf)
+            _deck_cache[key] = deck_path.name
+            _deck_cache.move_to_end(key)
+            while len(_deck_cache) > CACHE_MAX_ENTRIES:
+                _, evicted = _deck_cache.popitem(last=False)
+                (PUBLIC_DIR / evicted).unlink(missing_ok=True)
+        # ?format=redirect skips the body entirely: one 303 the client
+        # follows straight to /pptx/{name}. ?format=json keeps the old
+        # URL-in-a-body shape for API consumers; default streams the deck.
+        if format == "redirect":
+            return RedirectResponse(f"/pptx/{deck_path.name}", status_code=303)
+        if format == "json":
+            base = str(request.base_url).rstrip("/")
+            file_url = f"{base}/pptx/{deck_path.name}"
+            return {
+                "file_url": file_url,
+                "message": f"✅ Deck ready: [Download PowerPoint]({file_url})"
+            }
+        # the content hash doubles as the download filename; no uuid/urandom needed
+        return StreamingResponse(
+            iter([buf]),
+            media_type=PPTX_MEDIA_TYPE,
+            headers={"Content-Disposition": f'attachment; filename="{deck_path.name}"'},
+        )
     except Exception as e:
         print("ERROR /create_slide:", repr(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
-    schema = get_openapi(
-        title="Slide Generator",
-        version="1.0.0",
-        description="Creates simple PowerPoint decks from JSON input.",
-        routes=app.routes,
-    )
-    schema["servers"] = [
-        {"url": "https://slide-agent-xs03.onrender.com", "description": "Render deployment"}
-    ]
-    app.openapi_schema = schema
-    return app.openapi_schema
-
-app.openapi = custom_openapi
+@app.get("/pptx/{name}")
+async def download_deck(name: str):
+    # Direct download of a cached deck. FileResponse uses os.sendfile
+    # where available (zero-copy from the page cache); in production a
+    # reverse proxy can take over via X-Accel-Redirect.
+    if "/" in name or "\\" in name or ".." in name or not name.endswith(".pptx"):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = PUBLIC_DIR / name
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, media_type=PPTX_MEDIA_TYPE, filename=name)
 
 @app.get("/health")
 def health(): return {"ok": True}
\ No newline at end of file